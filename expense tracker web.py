@@ -1,13 +1,19 @@
-from flask import Flask, g, render_template_string, request, redirect, url_for, send_file, flash, jsonify
+from flask import Flask, g, request, redirect, url_for, flash, jsonify, Response, stream_with_context
 import sqlite3
 from pathlib import Path
-from datetime import date, datetime
+from datetime import date
+import time
 import csv
 import io
+import queue
+import itertools
+import threading
+from collections import namedtuple
 
 APP = Flask(__name__)
 APP.secret_key = "dev-secret-change-this"  # local-only; change if you plan to expose it
 DB_PATH = Path("expenses_web.db")
+DB_NAME = str(DB_PATH)
 
 SCHEMA = """
 CREATE TABLE IF NOT EXISTS transactions (
@@ -20,78 +26,235 @@ CREATE TABLE IF NOT EXISTS transactions (
     notes TEXT,
     created_at TEXT NOT NULL
 );
+-- listing order, category filter, and a covering index for the monthly sums
+CREATE INDEX IF NOT EXISTS idx_tx_date_id ON transactions(date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_tx_cat_date ON transactions(category, date);
+CREATE INDEX IF NOT EXISTS idx_tx_date_type_amount ON transactions(date, type, amount);
 """
 
+# Applied once per pooled connection: WAL for non-blocking reads, batched fsync,
+# a 64 MB page cache and memory-mapped I/O.
+PRAGMAS = """
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA temp_store=MEMORY;
+PRAGMA cache_size=-64000;
+PRAGMA mmap_size=2147483648;
+PRAGMA busy_timeout=5000;
+"""
+
+
+# Connections are reused across requests; each request checks one out and
+# hands it back on teardown. Extra connections beyond the pool size are closed.
+DB_POOL_SIZE = 8
+_DB_POOL = queue.Queue(maxsize=DB_POOL_SIZE)
+# refresh planner statistics every N requests; usually a no-op
+OPTIMIZE_EVERY = 500
+_REQUEST_COUNT = itertools.count(1)
+
+
+def connect_db():
+    db = sqlite3.connect(DB_NAME, check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    db.executescript(PRAGMAS)
+    return db
 
 def get_db():
     db = getattr(g, "_db", None)
     if db is None:
-        db = sqlite3.connect(str(DB_PATH))
-        db.row_factory = sqlite3.Row
+        try:
+            db = _DB_POOL.get_nowait()
+        except queue.Empty:
+            db = connect_db()
         g._db = db
     return db
 
 @APP.teardown_appcontext
 def close_db(exc):
-    db = getattr(g, "_db", None)
-    if db is not None:
+    db = g.pop("_db", None)
+    if db is None:
+        return
+    if db.in_transaction:
+        db.rollback()
+    if next(_REQUEST_COUNT) % OPTIMIZE_EVERY == 0:
+        db.execute("PRAGMA optimize")
+    try:
+        _DB_POOL.put_nowait(db)
+    except queue.Full:
+        db.execute("PRAGMA optimize")
         db.close()
 
 def init_db():
-    db = get_db()
-    db.executescript(SCHEMA)
-    db.commit()
+    db = connect_db()
+    try:
+        db.executescript(SCHEMA)
+        db.execute("ANALYZE")
+        db.commit()
+    finally:
+        db.close()
+
+# created_at stamps at one-second resolution; reformatted only when the second changes.
+# (second, text) is swapped in one assignment so concurrent readers never see a half update.
+_TS_CACHE = (-1, "")
+
+def utc_timestamp():
+    global _TS_CACHE
+    now = int(time.time())
+    cached = _TS_CACHE
+    if cached[0] == now:
+        return cached[1]
+    text = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(now))
+    _TS_CACHE = (now, text)
+    return text
+
+# monthly aggregates, keyed by query arguments; entries are (expires_at, value).
+# Writers bump _SUM_GEN and clear after committing; a reader only stores its
+# result if no write happened since it started, so a query that saw the
+# pre-write snapshot cannot repopulate the cache. The cache is per-process:
+# the TTL bounds staleness from writes made by other processes.
+_SUM_CACHE = {}
+_SUM_CACHE_MAX = 256
+_SUM_CACHE_TTL = 60.0
+_SUM_GEN = 0
+_SUM_LOCK = threading.Lock()
+
+def _cached_summary(key):
+    entry = _SUM_CACHE.get(key)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+    return None
+
+def _cache_summary(key, value, gen):
+    with _SUM_LOCK:
+        if gen != _SUM_GEN:
+            return
+        if len(_SUM_CACHE) >= _SUM_CACHE_MAX:
+            _SUM_CACHE.clear()
+        _SUM_CACHE[key] = (time.monotonic() + _SUM_CACHE_TTL, value)
+
+def _invalidate_summaries():
+    global _SUM_GEN
+    with _SUM_LOCK:
+        _SUM_GEN += 1
+        _SUM_CACHE.clear()
+
+# today's date as YYYY-MM-DD; reformatted only when the day rolls over.
+# (ordinal, text) is swapped in one assignment, like _TS_CACHE.
+_TODAY_CACHE = (0, "")
+
+def today_iso():
+    global _TODAY_CACHE
+    today = date.today()
+    cached = _TODAY_CACHE
+    if cached[0] == today.toordinal():
+        return cached[1]
+    text = today.isoformat()
+    _TODAY_CACHE = (today.toordinal(), text)
+    return text
+
+# SQL expression for the stored amount from ?2 (amount) and ?3 (type):
+# expense stored negative, income positive, anything else as given
+SIGNED_AMOUNT = "CASE ?3 WHEN 'expense' THEN -abs(?2) WHEN 'income' THEN abs(?2) ELSE ?2 END"
+INSERT_TX = ("INSERT INTO transactions (date, amount, type, category, tags, notes, created_at) "
+             f"VALUES (?1, {SIGNED_AMOUNT}, ?3, ?4, ?5, ?6, ?7)")
+UPDATE_TX = (f"UPDATE transactions SET date=?1, amount={SIGNED_AMOUNT}, type=?3, category=?4, tags=?5, notes=?6 "
+             "WHERE id=?7")
 
 def add_transaction(tx_date, amount, tx_type, category=None, tags=None, notes=None):
-    created = datetime.utcnow().isoformat()
-    # Normalize sign: expense stored negative, income positive
+    created = utc_timestamp()
     try:
         amt = float(amount)
     except:
         raise ValueError("Invalid amount")
-    if tx_type == "expense" and amt > 0:
-        amt = -abs(amt)
-    if tx_type == "income" and amt < 0:
-        amt = abs(amt)
     db = get_db()
-    db.execute("INSERT INTO transactions (date, amount, type, category, tags, notes, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
-               (tx_date, amt, tx_type, category, tags, notes, created))
+    db.execute(INSERT_TX, (tx_date, amt, tx_type, category, tags, notes, created))
     db.commit()
+    _invalidate_summaries()
 
 def update_transaction(tx_id, tx_date, amount, tx_type, category, tags, notes):
-    amt = float(amount)
-    if tx_type == "expense" and amt > 0:
-        amt = -abs(amt)
-    if tx_type == "income" and amt < 0:
-        amt = abs(amt)
     db = get_db()
-    db.execute("UPDATE transactions SET date=?, amount=?, type=?, category=?, tags=?, notes=? WHERE id=?",
-               (tx_date, amt, tx_type, category, tags, notes, tx_id))
+    db.execute(UPDATE_TX, (tx_date, float(amount), tx_type, category, tags, notes, tx_id))
     db.commit()
+    _invalidate_summaries()
+
+def bulk_add_transactions(rows):
+    # rows: iterable of (date, amount, type, category, tags, notes); one commit for the batch.
+    # If the caller already has a transaction open, the batch runs in a savepoint
+    # and the caller stays responsible for committing (and _invalidate_summaries()).
+    created = utc_timestamp()
+    params = [(tx_date, float(amount), tx_type, category, tags, notes, created)
+              for tx_date, amount, tx_type, category, tags, notes in rows]
+    db = get_db()
+    nested = db.in_transaction
+    db.execute("SAVEPOINT bulk_add" if nested else "BEGIN")
+    try:
+        db.executemany(INSERT_TX, params)
+    except Exception:
+        if nested:
+            db.execute("ROLLBACK TO bulk_add")
+            db.execute("RELEASE bulk_add")
+        else:
+            db.rollback()
+        raise
+    if nested:
+        db.execute("RELEASE bulk_add")
+        return
+    db.commit()
+    _invalidate_summaries()
 
 def delete_transaction(tx_id):
     db = get_db()
     db.execute("DELETE FROM transactions WHERE id=?", (tx_id,))
     db.commit()
+    _invalidate_summaries()
 
-def query_transactions(limit=1000, start_date=None, end_date=None, category=None):
-    q = "SELECT * FROM transactions WHERE 1=1"
-    params = []
-    if start_date:
+# columns the pages read; the CSV export also writes created_at
+COLS = "id, date, amount, type, category, tags, notes"
+EXPORT_COLS = COLS + ", created_at"
+# the listing only shows the start of long notes
+LIST_COLS = "id, date, amount, type, category, tags, substr(notes, 1, 320) AS notes"
+
+Tx = namedtuple("Tx", COLS)
+
+def tx_row(cur, row):
+    return Tx._make(row)
+
+def _filter_sql(cols, has_start, has_end, has_cat):
+    q = f"SELECT {cols} FROM transactions WHERE 1=1"
+    if has_start:
         q += " AND date >= ?"
-        params.append(start_date)
-    if end_date:
+    if has_end:
         q += " AND date <= ?"
-        params.append(end_date)
-    if category:
+    if has_cat:
         q += " AND category = ?"
-        params.append(category)
-    q += " ORDER BY date DESC, id DESC LIMIT ?"
+    return q + " ORDER BY date DESC, id DESC LIMIT ?"
+
+# every filter combination, built once so the SQL text is stable and
+# sqlite3's statement cache keeps each variant compiled
+_QUERIES = {
+    (cols, s, e, c): _filter_sql(cols, s, e, c)
+    for cols in (LIST_COLS, EXPORT_COLS)
+    for s in (False, True) for e in (False, True) for c in (False, True)
+}
+
+def build_query(cols, limit, start_date=None, end_date=None, category=None):
+    q = _QUERIES[(cols, bool(start_date), bool(end_date), bool(category))]
+    params = [p for p in (start_date, end_date, category) if p]
     params.append(limit)
-    cur = get_db().execute(q, params)
-    return cur.fetchall()
+    return q, params
+
+def query_transactions(limit=1000, start_date=None, end_date=None, category=None):
+    q, params = build_query(LIST_COLS, limit, start_date, end_date, category)
+    cur = get_db().cursor()
+    cur.row_factory = tx_row
+    return cur.execute(q, params).fetchall()
 
 def summary_by_month(year, month):
+    key = ("month", year, month)
+    cached = _cached_summary(key)
+    if cached is not None:
+        return dict(cached)
+    gen = _SUM_GEN
     start = date(year, month, 1).isoformat()
     if month == 12:
         end = date(year+1, 1, 1).isoformat()
@@ -107,7 +270,26 @@ def summary_by_month(year, month):
     income = row["income"] or 0.0
     expense = row["expense"] or 0.0
     net = income - expense
-    return {"income": income, "expense": expense, "net": net}
+    result = {"income": income, "expense": expense, "net": net}
+    _cache_summary(key, result, gen)
+    return dict(result)
+
+def summary_range(start, end):
+    key = ("range", start, end)
+    cached = _cached_summary(key)
+    if cached is not None:
+        return dict(cached)
+    gen = _SUM_GEN
+    cur = get_db().execute(
+        "SELECT substr(date, 1, 7) as ym, "
+        "SUM(CASE WHEN type='income' THEN amount ELSE 0 END) as income, "
+        "SUM(CASE WHEN type='expense' THEN -amount ELSE 0 END) as expense "
+        "FROM transactions WHERE date >= ? AND date < ? GROUP BY ym",
+        (start, end)
+    )
+    result = {row["ym"]: (row["income"] or 0.0, row["expense"] or 0.0) for row in cur}
+    _cache_summary(key, result, gen)
+    return dict(result)
 
 BASE_HTML = """
 <!doctype html>
@@ -116,6 +298,7 @@ BASE_HTML = """
 <meta charset="utf-8">
 <title>Expenses & Savings Tracker — Web</title>
 <meta name="viewport" content="width=device-width,initial-scale=1">
+<link rel="preconnect" href="https://cdn.jsdelivr.net">
 <link href="https://cdn.jsdelivr.net/npm/water.css@2/out/water.css" rel="stylesheet">
 <style>
   .small { font-size: 0.9rem; color: #444;}
@@ -210,17 +393,17 @@ INDEX_HTML = """
       </tr>
     </thead>
     <tbody>
-      {% for r in rows %}
+      {% for tx_id, tx_date, amount, tx_type, category, tags, notes in rows %}
         <tr>
-          <td>{{ r.date }}</td>
-          <td class="nowrap">{{ "%.2f"|format(r.amount) }}</td>
-          <td>{{ r.type }}</td>
-          <td>{{ r.category or "" }}</td>
-          <td>{{ r.tags or "" }}</td>
-          <td class="notes">{{ r.notes or "" }}</td>
+          <td>{{ tx_date }}</td>
+          <td class="nowrap">{{ amount }}</td>
+          <td>{{ tx_type }}</td>
+          <td>{{ category }}</td>
+          <td>{{ tags }}</td>
+          <td class="notes">{{ notes }}</td>
           <td class="nowrap">
-            <a href="{{ url_for('edit', tx_id=r.id) }}">Edit</a> |
-            <a href="{{ url_for('delete', tx_id=r.id) }}" onclick="return confirm('Delete?')">Delete</a>
+            <a href="{{ url_for('edit', tx_id=tx_id) }}">Edit</a> |
+            <a href="{{ url_for('delete', tx_id=tx_id) }}" onclick="return confirm('Delete?')">Delete</a>
           </td>
         </tr>
       {% else %}
@@ -293,22 +476,24 @@ DASH_HTML = """
   </div>
 </section>
 
-<script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
+<script defer src="https://cdn.jsdelivr.net/npm/chart.js"></script>
 <script>
-  const labels = {{ months|tojson }};
-  const incomes = {{ incs|tojson }};
-  const expenses = {{ exps|tojson }};
-  const ctx = document.getElementById('chart').getContext('2d');
-  new Chart(ctx, {
-    type: 'bar',
-    data: {
-      labels: labels,
-      datasets: [
-        { label: 'Income', data: incomes },
-        { label: 'Expense', data: expenses }
-      ]
-    },
-    options: { responsive: true, scales: { x: { stacked: true }, y: { stacked: true } } }
+  document.addEventListener('DOMContentLoaded', function () {
+    const labels = {{ months|tojson }};
+    const incomes = {{ incs|tojson }};
+    const expenses = {{ exps|tojson }};
+    const ctx = document.getElementById('chart').getContext('2d');
+    new Chart(ctx, {
+      type: 'bar',
+      data: {
+        labels: labels,
+        datasets: [
+          { label: 'Income', data: incomes },
+          { label: 'Expense', data: expenses }
+        ]
+      },
+      options: { responsive: true, scales: { x: { stacked: true }, y: { stacked: true } } }
+    });
   });
 </script>
 {% endblock %}
@@ -326,12 +511,14 @@ APP.jinja_loader = DictLoader({
     "edit.html": EDIT_HTML,
     "dash.html": DASH_HTML
 })
+# compiled once; rendering these directly avoids re-parsing the output as a template
+INDEX_TMPL = APP.jinja_env.get_template("index.html")
+EDIT_TMPL = APP.jinja_env.get_template("edit.html")
+DASH_TMPL = APP.jinja_env.get_template("dash.html")
 
 
-@APP.before_request
-def ensure_db():
-    if not DB_PATH.exists():
-        init_db()
+# the schema is idempotent, so create/upgrade it once at startup
+init_db()
 
 @APP.route("/")
 def index():
@@ -339,16 +526,17 @@ def index():
     end = request.args.get("to") or None
     cat = request.args.get("category") or None
     rows = query_transactions(limit=1000, start_date=start, end_date=end, category=cat)
-    return render_template_string(APP.jinja_env.get_template("index.html").render(
-        rows=rows, today=date.today().isoformat(), db_name=str(DB_PATH)
-    ))
+    # format in Python so the template loop only unpacks plain strings
+    rows = [(r.id, r.date, f"{r.amount:.2f}", r.type, r.category or "", r.tags or "", r.notes or "")
+            for r in rows]
+    return INDEX_TMPL.render(rows=rows, today=today_iso(), db_name=DB_NAME)
 
 @APP.route("/add", methods=["POST"])
 def add():
     try:
-        tx_date = request.form.get("date") or date.today().isoformat()
-        # validate
-        datetime.strptime(tx_date, "%Y-%m-%d")
+        tx_date = request.form.get("date") or today_iso()
+        # validate and normalize to YYYY-MM-DD
+        tx_date = date.fromisoformat(tx_date).isoformat()
         amount = request.form["amount"]
         tx_type = request.form.get("type", "expense")
         category = request.form.get("category") or None
@@ -362,16 +550,16 @@ def add():
 
 @APP.route("/edit/<int:tx_id>", methods=["GET", "POST"])
 def edit(tx_id):
-    db = get_db()
-    cur = db.execute("SELECT * FROM transactions WHERE id=?", (tx_id,))
-    tx = cur.fetchone()
+    cur = get_db().cursor()
+    cur.row_factory = tx_row
+    tx = cur.execute(f"SELECT {COLS} FROM transactions WHERE id=?", (tx_id,)).fetchone()
     if not tx:
         flash("Transaction not found.")
         return redirect(url_for("index"))
     if request.method == "POST":
         try:
-            tx_date = request.form.get("date") or date.today().isoformat()
-            datetime.strptime(tx_date, "%Y-%m-%d")
+            tx_date = request.form.get("date") or today_iso()
+            tx_date = date.fromisoformat(tx_date).isoformat()
             amount = request.form["amount"]
             tx_type = request.form.get("type", "expense")
             category = request.form.get("category") or None
@@ -384,7 +572,7 @@ def edit(tx_id):
             flash(f"Error updating: {e}")
             return redirect(url_for("edit", tx_id=tx_id))
 
-    return render_template_string(APP.jinja_env.get_template("edit.html").render(tx=tx, db_name=str(DB_PATH)))
+    return EDIT_TMPL.render(tx=tx, db_name=DB_NAME)
 
 @APP.route("/delete/<int:tx_id>")
 def delete(tx_id):
@@ -400,37 +588,49 @@ def export_csv():
     start = request.args.get("from") or None
     end = request.args.get("to") or None
     cat = request.args.get("category") or None
-    rows = query_transactions(limit=10000, start_date=start, end_date=end, category=cat)
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["id","date","amount","type","category","tags","notes","created_at"])
-    for r in rows:
-        writer.writerow([r["id"], r["date"], r["amount"], r["type"], r["category"], r["tags"], r["notes"], r["created_at"]])
-    output.seek(0)
-    return send_file(io.BytesIO(output.getvalue().encode("utf-8")), mimetype="text/csv", as_attachment=True, download_name="transactions.csv")
+    q, params = build_query(EXPORT_COLS, 10000, start, end, cat)
+
+    def generate():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(EXPORT_COLS.split(", "))
+        yield buf.getvalue()
+        cur = get_db().cursor()
+        cur.row_factory = None  # plain tuples, written as-is by csv
+        cur.execute(q, params)
+        while True:
+            batch = cur.fetchmany(1000)
+            if not batch:
+                break
+            buf.seek(0)
+            buf.truncate()
+            writer.writerows(batch)
+            yield buf.getvalue()
+
+    return Response(stream_with_context(generate()), mimetype="text/csv",
+                    headers={"Content-Disposition": "attachment; filename=transactions.csv"})
 
 @APP.route("/dashboard")
 def dashboard():
 
     today = date.today()
-    s = summary_by_month(today.year, today.month)
-    # last 12 months
+    # last 12 months, oldest first
     labels = []
-    incs = []
-    exps = []
-    y = today.year
-    m = today.month
-    for i in range(12):
-
-        yy = y - ((12 - m + i) // 12)
-        mm = ((m - 1 + i) % 12) + 1
-        labels.append(f"{yy}-{mm:02d}")
-        row = summary_by_month(yy, mm)
-        incs.append(row["income"])
-        exps.append(row["expense"])
-    return render_template_string(APP.jinja_env.get_template("dash.html").render(
-        month_summary=s, months=labels, incs=incs, exps=exps, db_name=str(DB_PATH)
-    ))
+    for i in range(11, -1, -1):
+        yy, mm = divmod(today.year * 12 + today.month - 1 - i, 12)
+        labels.append(f"{yy}-{mm + 1:02d}")
+    start = labels[0] + "-01"
+    if today.month == 12:
+        end = date(today.year + 1, 1, 1).isoformat()
+    else:
+        end = date(today.year, today.month + 1, 1).isoformat()
+    sums = summary_range(start, end)
+    # one lookup per month, split into the income and expense series
+    incs, exps = map(list, zip(*[sums.get(ym, (0.0, 0.0)) for ym in labels]))
+    # the window ends with the current month, so its summary comes from the same query
+    income, expense = sums.get(labels[-1], (0.0, 0.0))
+    s = {"income": income, "expense": expense, "net": income - expense}
+    return DASH_TMPL.render(month_summary=s, months=labels, incs=incs, exps=exps, db_name=DB_NAME)
 
 @APP.route("/api/summary_month/<int:year>/<int:month>")
 def api_summary_month(year, month):
@@ -438,8 +638,4 @@ def api_summary_month(year, month):
 
 
 if __name__ == "__main__":
-    # ensure DB and tables
-    if not DB_PATH.exists():
-        with sqlite3.connect(str(DB_PATH)) as conn:
-            conn.executescript(SCHEMA)
     APP.run(debug=True)